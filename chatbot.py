@@ -4,7 +4,7 @@ Gradio Chatbot for vLLM
 A simple web-based chatbot interface that connects to vLLM using OpenAI-compatible API.
 
 Requirements:
-    pip install gradio openai
+    pip install gradio openai httpx
 
 Usage:
     python chatbot.py
@@ -12,265 +12,372 @@ Usage:
 Then open http://localhost:7860 in your browser.
 """
 
-import gradio as gr
-from openai import OpenAI
+import httpx
+from openai import AsyncOpenAI, OpenAI
 import sys
 import os
+import threading
+import time
 
 # Configuration from environment variables
 VLLM_BASE_URL = os.getenv("VLLM_BASE_URL", "http://localhost:8009/v1")
 MODEL_NAME = os.getenv("MODEL_NAME", "HuggingFaceTB/SmolLM2-360M-Instruct")
 
-# Initialize OpenAI client pointing to vLLM
-try:
-    client = OpenAI(
-        base_url=VLLM_BASE_URL,
-        api_key="dummy"  # vLLM doesn't require authentication
-    )
-except Exception as e:
-    print(f"Error initializing OpenAI client: {e}")
-    sys.exit(1)
-
-
-def chat(message, history, temperature, max_tokens, system_prompt):
-    """
-    Chat function that processes user messages and returns AI responses.
-
-    Args:
-        message: Current user message
-        history: List of (user_msg, bot_msg) tuples
-        temperature: Sampling temperature (0.0 - 2.0)
-        max_tokens: Maximum tokens to generate
-        system_prompt: System message to set chatbot behavior
-
-    Yields:
-        Partial responses as they're generated (streaming)
-    """
-    # Build messages list for OpenAI API
-    messages = []
-
-    # Add system prompt if provided
-    if system_prompt and system_prompt.strip():
-        messages.append({
-            "role": "system",
-            "content": system_prompt
-        })
-
-    # Convert history from tuples to message format
-    for user_msg, bot_msg in history:
-        if user_msg:
-            messages.append({"role": "user", "content": user_msg})
-        if bot_msg:
-            messages.append({"role": "assistant", "content": bot_msg})
-
-    # Add current message
-    messages.append({"role": "user", "content": message})
+# Conversation window sent to vLLM. The window start only moves once the
+# history grows past WINDOW_MAX messages, so consecutive turns share the
+# same prompt prefix and hit vLLM's prefix cache.
+WINDOW_MAX = 40
+WINDOW_MIN = 20
 
-    try:
-        # Create streaming completion
-        stream = client.chat.completions.create(
-            model=MODEL_NAME,
-            messages=messages,
-            temperature=temperature,
-            max_tokens=max_tokens,
-            stream=True
-        )
+# Streamed tokens are coalesced into one UI update every YIELD_INTERVAL
+# seconds or YIELD_TOKENS tokens, whichever comes first
+YIELD_INTERVAL = 0.03
+YIELD_TOKENS = 8
 
-        # Stream response token by token
-        response = ""
-        for chunk in stream:
-            if chunk.choices[0].delta.content:
-                response += chunk.choices[0].delta.content
-                yield response
+# Number of chat sessions streamed concurrently (vLLM batches them)
+CONCURRENCY_LIMIT = int(os.getenv("CONCURRENCY_LIMIT", "8"))
 
-    except Exception as e:
-        error_msg = f"Error: {str(e)}\n\nMake sure vLLM is running at {VLLM_BASE_URL}"
-        yield error_msg
+# Every generated token costs ~50-200 ms on CPU, so keep replies short
+DEFAULT_MAX_TOKENS = 128
+SLOW_MAX_TOKENS = 400
 
+# Quick action prompts
+DOCKER_PROMPT = "Explain what Docker is and how it works."
+FACTORIAL_PROMPT = "Write a Python function to calculate the factorial of a number with error handling."
+HAIKU_PROMPT = "Write a haiku about artificial intelligence and containers."
 
-# Create Gradio interface
-with gr.Blocks(title="vLLM Chatbot") as demo:
-    gr.Markdown(
-        """
-        # 🤖 vLLM Chatbot
+# Last polled vLLM health status and when it was taken (monotonic time)
+_health = [False, 0.0]
 
-        Chat with SmolLM2 running on your local vLLM server.
+CONNECTION_ERROR = (
+    "Connection Error: {error}\n\nPlease check:\n"
+    "1. vLLM is running: docker compose ps\n"
+    "2. API endpoint: {endpoint}"
+)
 
-        **Model:** {model}
-        **Endpoint:** {endpoint}
-        """.format(model=MODEL_NAME, endpoint=VLLM_BASE_URL)
+
+def create_clients():
+    """Create the sync (startup probe) and async (UI) clients for vLLM."""
+    client = OpenAI(
+        base_url=VLLM_BASE_URL,
+        api_key="dummy"  # vLLM doesn't require authentication
+    )
+    # Async client used by the UI so one event loop serves all streams
+    aclient = AsyncOpenAI(
+        base_url=VLLM_BASE_URL,
+        api_key="dummy",
+        http_client=httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=64, max_keepalive_connections=32)
+        )
     )
+    return client, aclient
 
-    with gr.Row():
-        with gr.Column(scale=3):
-            # Main chat interface
-            chatbot = gr.Chatbot(
-                label="Conversation",
-                height=500
-            )
 
-            msg = gr.Textbox(
-                label="Your message",
-                placeholder="Type your message here and press Enter...",
-                lines=2
-            )
+def poll_health(interval=1.0):
+    """Refresh the cached vLLM health status forever (run in a thread)."""
+    global _health
+    health_url = f"{VLLM_BASE_URL.replace('/v1', '')}/health"
+    with httpx.Client(timeout=2.0) as http:
+        while True:
+            try:
+                healthy = http.get(health_url).status_code == 200
+            except Exception:
+                healthy = False
+            _health = [healthy, time.monotonic()]
+            time.sleep(interval)
 
-            with gr.Row():
-                submit = gr.Button("Send", variant="primary")
-                clear = gr.Button("Clear")
 
-        with gr.Column(scale=1):
-            # Settings panel
-            gr.Markdown("### Settings")
+def probe_models(client, model_info):
+    """Record the models served by vLLM (or the error) in model_info."""
+    try:
+        model_info["models"] = [m.id for m in client.models.list().data]
+        print(f"✓ Connected successfully!")
+        print(f"✓ Available models: {model_info['models']}")
+    except Exception as e:
+        model_info["error"] = str(e)
+        print(f"✗ Warning: Could not connect to vLLM")
+        print(f"  Error: {e}")
+        print(f"\n  Make sure vLLM is running:")
+        print(f"    docker compose ps")
+        print(f"    curl {VLLM_BASE_URL.replace('/v1', '')}/health")
+        print(f"\n  Continuing anyway - you can start vLLM later.")
 
-            system_prompt = gr.Textbox(
-                label="System Prompt",
-                placeholder="You are a helpful assistant.",
-                value="You are a helpful AI assistant.",
-                lines=3
-            )
 
-            temperature = gr.Slider(
-                minimum=0.0,
-                maximum=2.0,
-                value=0.7,
-                step=0.1,
-                label="Temperature",
-                info="Higher = more creative, Lower = more focused"
-            )
+def log_usage(usage, ttft, elapsed):
+    """Print token usage, time to first token and decode tokens/s for one reply."""
+    if ttft is None:
+        print(
+            f"Usage: {usage.prompt_tokens} prompt + {usage.completion_tokens} "
+            f"completion tokens, no content received in {elapsed:.2f}s"
+        )
+        return
+    # Decode rate excludes prefill (TTFT) and the first token it produced
+    decode_time = elapsed - ttft
+    tps = (usage.completion_tokens - 1) / decode_time if decode_time > 0 else 0.0
+    print(
+        f"Usage: {usage.prompt_tokens} prompt + {usage.completion_tokens} "
+        f"completion tokens, TTFT {ttft:.2f}s, decode {tps:.1f} tok/s"
+    )
 
-            max_tokens = gr.Slider(
-                minimum=50,
-                maximum=500,
-                value=200,
-                step=10,
-                label="Max Tokens",
-                info="Maximum length of response"
-            )
 
-            gr.Markdown("### Quick Actions")
-            example_btn1 = gr.Button("💡 Explain Docker", size="sm")
-            example_btn2 = gr.Button("💻 Write Python code", size="sm")
-            example_btn3 = gr.Button("📝 Write a poem", size="sm")
-
-    # Examples section
-    gr.Markdown("### Example Questions")
-    gr.Examples(
-        examples=[
-            ["What is vLLM and how does it work?"],
-            ["Explain the difference between Docker and Kubernetes."],
-            ["Write a Python function to check if a number is prime."],
-            ["What are the benefits of using containers?"],
-            ["How do I optimize Docker images for production?"],
-        ],
-        inputs=msg,
-    )
+def format_status(model_info):
+    """Render the connection probe result as Markdown."""
+    if "models" in model_info:
+        return f"**Status:** ✓ Connected ({', '.join(model_info['models'])})"
+    if "error" in model_info:
+        return f"**Status:** ✗ Could not connect to vLLM: {model_info['error']}"
+    return "**Status:** Checking vLLM connection..."
 
-    # Info section
-    with gr.Accordion("ℹ️ About", open=False):
+
+def build_demo(aclient, model_info):
+    """Create the Gradio interface, streaming replies through aclient."""
+    # Imported here so importing this module does not load Gradio
+    import gradio as gr
+
+    with gr.Blocks(title="vLLM Chatbot") as demo:
         gr.Markdown(
             """
-            This chatbot demonstrates local LLM inference using:
-            - **vLLM**: High-performance inference engine
-            - **SmolLM2**: Small but capable language model
-            - **Gradio**: Interactive web interface
-            - **OpenAI API**: Compatible endpoint
-
-            ### Tips:
-            - Adjust temperature for creativity vs. consistency
-            - Use system prompts to guide the chatbot's behavior
-            - Lower max_tokens for faster responses
-            - Higher max_tokens for detailed answers
-
-            ### Troubleshooting:
-            If you get connection errors:
-            1. Check vLLM is running: `docker compose ps`
-            2. Verify health: `curl http://localhost:8009/health`
-            3. Check logs: `docker compose logs -f vllm-cpu`
-            """
+            # 🤖 vLLM Chatbot
+
+            Chat with SmolLM2 running on your local vLLM server.
+
+            **Model:** {model}
+            **Endpoint:** {endpoint}
+            """.format(model=MODEL_NAME, endpoint=VLLM_BASE_URL)
+        )
+        # Refreshed from the background connection probe until it finishes
+        status = gr.Markdown(format_status(model_info))
+        status_timer = gr.Timer(2)
+
+        with gr.Row():
+            with gr.Column(scale=3):
+                # Main chat interface
+                chatbot = gr.Chatbot(
+                    label="Conversation",
+                    height=500,
+                    type="messages"
+                )
+                window_start = gr.State(0)
+                # System message list, rebuilt only when the prompt changes
+                prefix = gr.State({"sys": None, "msgs": []})
+
+                msg = gr.Textbox(
+                    label="Your message",
+                    placeholder="Type your message here and press Enter...",
+                    lines=2
+                )
+
+                with gr.Row():
+                    submit = gr.Button("Send", variant="primary")
+                    clear = gr.Button("Clear")
+
+            with gr.Column(scale=1):
+                # Settings panel
+                gr.Markdown("### Settings")
+
+                system_prompt = gr.Textbox(
+                    label="System Prompt",
+                    placeholder="You are a helpful assistant.",
+                    value="You are a helpful AI assistant. Be concise.",
+                    lines=3
+                )
+
+                temperature = gr.Slider(
+                    minimum=0.0,
+                    maximum=2.0,
+                    value=0.7,
+                    step=0.1,
+                    label="Temperature",
+                    info="Higher = more creative, Lower = more focused"
+                )
+
+                max_tokens = gr.Slider(
+                    minimum=32,
+                    maximum=512,
+                    value=DEFAULT_MAX_TOKENS,
+                    step=16,
+                    label="Max Tokens",
+                    info="Maximum length of response"
+                )
+
+                gr.Markdown("### Quick Actions")
+                example_btn1 = gr.Button("💡 Explain Docker", size="sm")
+                example_btn2 = gr.Button("💻 Write Python code", size="sm")
+                example_btn3 = gr.Button("📝 Write a poem", size="sm")
+
+        # Examples section
+        gr.Markdown("### Example Questions")
+        gr.Examples(
+            examples=[
+                ["What is vLLM and how does it work?"],
+                ["Explain the difference between Docker and Kubernetes."],
+                ["Write a Python function to check if a number is prime."],
+                ["What are the benefits of using containers?"],
+                ["How do I optimize Docker images for production?"],
+            ],
+            inputs=msg,
         )
 
-    # Event handlers
-    def respond(message, history, temp, tokens, sys_prompt):
-        """Handle chat submission and return updated history."""
-        # Build messages for API
-        messages = []
-
-        if sys_prompt and sys_prompt.strip():
-            messages.append({"role": "system", "content": sys_prompt})
-
-        # Add history (already in dict format from Gradio)
-        if history:
-            messages.extend(history)
-
-        # Add current message
-        messages.append({"role": "user", "content": message})
-
-        try:
-            # Call API
-            stream = client.chat.completions.create(
-                model=MODEL_NAME,
-                messages=messages,
-                temperature=temp,
-                max_tokens=tokens,
-                stream=True
+        # Info section
+        with gr.Accordion("ℹ️ About", open=False):
+            gr.Markdown(
+                """
+                This chatbot demonstrates local LLM inference using:
+                - **vLLM**: High-performance inference engine
+                - **SmolLM2**: Small but capable language model
+                - **Gradio**: Interactive web interface
+                - **OpenAI API**: Compatible endpoint
+
+                ### Tips:
+                - Adjust temperature for creativity vs. consistency
+                - Use system prompts to guide the chatbot's behavior
+                - Lower max_tokens for faster responses
+                - Higher max_tokens for detailed answers
+
+                ### Troubleshooting:
+                If you get connection errors:
+                1. Check vLLM is running: `docker compose ps`
+                2. Verify health: `curl http://localhost:8009/health`
+                3. Check logs: `docker compose logs -f vllm-cpu`
+                """
             )
 
-            # Build new history with user message and streaming response
-            new_history = history + [{"role": "user", "content": message}]
-            response = ""
-
-            for chunk in stream:
-                if chunk.choices[0].delta.content:
-                    response += chunk.choices[0].delta.content
-                    # Yield updated history with assistant response
-                    yield new_history + [{"role": "assistant", "content": response}]
-
-        except Exception as e:
-            # Log error to console for debugging
-            print(f"ERROR: {type(e).__name__}: {str(e)}")
-            # Provide helpful error message to user
-            error_msg = f"Connection Error: {str(e)}\n\nPlease check:\n1. vLLM is running: docker compose ps\n2. API endpoint: {VLLM_BASE_URL}"
-            new_history = history + [{"role": "user", "content": message}]
-            yield new_history + [{"role": "assistant", "content": error_msg}]
-
-    # Submit on button click or Enter key
-    msg.submit(
-        respond,
-        inputs=[msg, chatbot, temperature, max_tokens, system_prompt],
-        outputs=chatbot
-    ).then(
-        lambda: "",  # Clear input after submission
-        outputs=msg
-    )
+        # Event handlers
+        async def respond(message, history, temp, tokens, sys_prompt, start, prefix):
+            """Handle chat submission and return updated history, window start and prefix."""
+            history = history or []
+
+            if tokens > SLOW_MAX_TOKENS:
+                gr.Warning("Large max_tokens will be slow on CPU")
+
+            # History can shrink without going through the Clear button
+            # (e.g. the Chatbot's own clear control), so start over then
+            if start > len(history):
+                start = 0
+
+            # Only move the window start when the cap is hit, keeping the
+            # prompt prefix stable between turns
+            if len(history) - start > WINDOW_MAX:
+                start = len(history) - WINDOW_MIN
+
+            # Reuse the cached system message unless the prompt changed
+            if prefix["sys"] != sys_prompt:
+                prefix["sys"] = sys_prompt
+                prefix["msgs"] = (
+                    [{"role": "system", "content": sys_prompt}]
+                    if sys_prompt and sys_prompt.strip()
+                    else []
+                )
+
+            # Build messages for API
+            user_turn = {"role": "user", "content": message}
+            messages = prefix["msgs"] + history[start:] + [user_turn]
+            new_history = history + [user_turn]
+
+            # Fail fast if the health poller recently saw vLLM down
+            healthy, checked_at = _health
+            if not healthy and time.monotonic() - checked_at < 2:
+                error_msg = CONNECTION_ERROR.format(
+                    error="vLLM health check failed", endpoint=VLLM_BASE_URL
+                )
+                yield new_history + [{"role": "assistant", "content": error_msg}], start, prefix
+                return
+
+            try:
+                # Call API
+                t0 = time.monotonic()
+                stream = await aclient.chat.completions.create(
+                    model=MODEL_NAME,
+                    messages=messages,
+                    temperature=temp,
+                    max_tokens=tokens,
+                    stream=True,
+                    stream_options={"include_usage": True}
+                )
+
+                # Stream the assistant response after the user message
+                parts = []
+                pending = 0
+                last = t0
+                ttft = None
+                usage = None
+
+                async for chunk in stream:
+                    choices = chunk.choices
+                    if not choices:
+                        # The final chunk carries only the usage summary
+                        usage = chunk.usage or usage
+                        continue
+                    delta = choices[0].delta.content
+                    if not delta:
+                        continue
+                    if ttft is None:
+                        ttft = time.monotonic() - t0
+                    parts.append(delta)
+                    pending += 1
+                    now = time.monotonic()
+                    if pending >= YIELD_TOKENS or now - last > YIELD_INTERVAL:
+                        # Yield updated history with assistant response
+                        yield new_history + [{"role": "assistant", "content": "".join(parts)}], start, prefix
+                        last = now
+                        pending = 0
+
+                # Stop the clock before the final UI update
+                elapsed = time.monotonic() - t0
+
+                # Flush any tokens received since the last update
+                yield new_history + [{"role": "assistant", "content": "".join(parts)}], start, prefix
+
+                if usage:
+                    log_usage(usage, ttft, elapsed)
+
+            except Exception as e:
+                # Log error to console for debugging
+                print(f"ERROR: {type(e).__name__}: {str(e)}")
+                # Provide helpful error message to user
+                error_msg = CONNECTION_ERROR.format(error=e, endpoint=VLLM_BASE_URL)
+                yield new_history + [{"role": "assistant", "content": error_msg}], start, prefix
+
+        # Submit on button click or Enter key
+        msg.submit(
+            respond,
+            inputs=[msg, chatbot, temperature, max_tokens, system_prompt, window_start, prefix],
+            outputs=[chatbot, window_start, prefix],
+            concurrency_limit=CONCURRENCY_LIMIT
+        ).then(
+            lambda: "",  # Clear input after submission
+            outputs=msg
+        )
 
-    submit.click(
-        respond,
-        inputs=[msg, chatbot, temperature, max_tokens, system_prompt],
-        outputs=chatbot
-    ).then(
-        lambda: "",
-        outputs=msg
-    )
+        submit.click(
+            respond,
+            inputs=[msg, chatbot, temperature, max_tokens, system_prompt, window_start, prefix],
+            outputs=[chatbot, window_start, prefix],
+            concurrency_limit=CONCURRENCY_LIMIT
+        ).then(
+            lambda: "",
+            outputs=msg
+        )
 
-    # Clear conversation
-    clear.click(lambda: None, outputs=chatbot)
+        # Clear conversation
+        clear.click(lambda: ([], 0), outputs=[chatbot, window_start])
+        # The Chatbot's built-in clear control (Gradio 5) resets the window too
+        if hasattr(chatbot, "clear"):
+            chatbot.clear(lambda: 0, outputs=window_start)
 
-    # Example button handlers
-    example_btn1.click(
-        lambda: "Explain what Docker is and how it works.",
-        outputs=msg
-    )
+        # Example button handlers
+        example_btn1.click(lambda: DOCKER_PROMPT, outputs=msg)
+        example_btn2.click(lambda: FACTORIAL_PROMPT, outputs=msg)
+        example_btn3.click(lambda: HAIKU_PROMPT, outputs=msg)
 
-    example_btn2.click(
-        lambda: "Write a Python function to calculate the factorial of a number with error handling.",
-        outputs=msg
-    )
+        def refresh_status():
+            # Stop polling once the probe has recorded models or an error
+            return format_status(model_info), gr.Timer(active=not model_info)
 
-    example_btn3.click(
-        lambda: "Write a haiku about artificial intelligence and containers.",
-        outputs=msg
-    )
+        demo.load(refresh_status, outputs=[status, status_timer])
+        status_timer.tick(refresh_status, outputs=[status, status_timer])
+
+    return demo
 
 
 if __name__ == "__main__":
@@ -281,24 +388,29 @@ if __name__ == "__main__":
     print(f"Endpoint: {VLLM_BASE_URL}")
     print("\nChecking vLLM connection...")
 
-    # Test connection before starting
+    # Initialize OpenAI clients pointing to vLLM
     try:
-        models = client.models.list()
-        print(f"✓ Connected successfully!")
-        print(f"✓ Available models: {[m.id for m in models.data]}")
+        client, aclient = create_clients()
     except Exception as e:
-        print(f"✗ Warning: Could not connect to vLLM")
-        print(f"  Error: {e}")
-        print(f"\n  Make sure vLLM is running:")
-        print(f"    docker compose ps")
-        print(f"    curl {VLLM_BASE_URL.replace('/v1', '')}/health")
-        print(f"\n  Continuing anyway - you can start vLLM later.")
+        print(f"Error initializing OpenAI client: {e}")
+        sys.exit(1)
+
+    # Keep a cached health status for respond() to check
+    threading.Thread(target=poll_health, daemon=True).start()
+
+    # Test connection in the background while the UI starts
+    model_info = {}
+    threading.Thread(
+        target=probe_models, args=(client, model_info), daemon=True
+    ).start()
 
     print("\n" + "=" * 60)
     print("Starting Gradio interface...")
     print("=" * 60)
 
     # Launch Gradio
+    demo = build_demo(aclient, model_info)
+    demo.queue(default_concurrency_limit=CONCURRENCY_LIMIT, max_size=64)
     demo.launch(
         server_name="0.0.0.0",
         server_port=7860,
@@ -4,20 +4,26 @@ Test script for vLLM CPU deployment.
 Demonstrates various API usage patterns.
 
 Requirements:
-    pip install openai requests
+    pip install openai requests httpx orjson
 """
 
+import asyncio
+import io
 import json
 import sys
+import threading
 import time
-from typing import Optional
+from typing import Optional, TextIO
 
 try:
+    import httpx
+    import orjson
     import requests
-    from openai import OpenAI
+    from openai import AsyncOpenAI
+    from requests.adapters import HTTPAdapter
 except ImportError:
     print("Error: Required packages not installed.")
-    print("Please run: pip install openai requests")
+    print("Please run: pip install openai requests httpx orjson")
     sys.exit(1)
 
 
@@ -27,12 +33,66 @@ class VLLMTester:
     def __init__(self, base_url: str = "http://localhost:8009"):
         self.base_url = base_url
         self.v1_url = f"{base_url}/v1"
-        self.client = OpenAI(base_url=self.v1_url, api_key="dummy")
+
+        # Async clients for the API tests, which run concurrently
+        self.http = httpx.AsyncClient(
+            headers={"Content-Type": "application/json"},
+            timeout=30.0,
+        )
+        self.client = AsyncOpenAI(
+            base_url=self.v1_url, api_key="dummy", http_client=self.http
+        )
+
+        # Reuse one connection pool for the sync health and model probes
+        self.session = requests.Session()
+        self.session.headers.update({"Content-Type": "application/json"})
+        self.session.mount(
+            "http://", HTTPAdapter(pool_connections=4, pool_maxsize=16)
+        )
+
+        # Last polled health status, when it was taken (monotonic time)
+        # and the failure reason, if any
+        self._health = [False, 0.0, None]
+        self._stop = threading.Event()
+        threading.Thread(target=self._poll_health, daemon=True).start()
+
+    def close(self) -> None:
+        """Stop the health poller and release pooled HTTP connections."""
+        self._stop.set()
+        self.session.close()
+
+    async def aclose(self) -> None:
+        """Release the async clients' connections."""
+        await self.client.close()
+        await self.http.aclose()
+
+    def _poll_health(self, interval: float = 1.0) -> None:
+        """Refresh the cached health status until close() is called."""
+        # Own session: requests.Session is not safe to share across threads
+        with requests.Session() as session:
+            while not self._stop.is_set():
+                error = None
+                try:
+                    response = session.get(f"{self.base_url}/health", timeout=2)
+                    if response.status_code != 200:
+                        error = response.status_code
+                except requests.exceptions.RequestException as e:
+                    error = e
+                self._health = [error is None, time.monotonic(), error]
+                self._stop.wait(interval)
 
     def check_health(self) -> bool:
         """Check if vLLM service is healthy."""
+        healthy, checked_at, error = self._health
+        if time.monotonic() - checked_at < 2:
+            if healthy:
+                print("✓ Health check passed")
+            else:
+                print(f"✗ Health check failed: {error}")
+            return healthy
+
         try:
-            response = requests.get(f"{self.base_url}/health", timeout=5)
+            response = self.session.get(f"{self.base_url}/health", timeout=5)
             if response.status_code == 200:
                 print("✓ Health check passed")
                 return True
@@ -46,7 +106,7 @@ class VLLMTester:
     def list_models(self) -> Optional[list]:
         """List available models."""
         try:
-            response = requests.get(f"{self.v1_url}/models", timeout=10)
+            response = self.session.get(f"{self.v1_url}/models", timeout=10)
             if response.status_code == 200:
                 data = response.json()
                 models = data.get("data", [])
@@ -61,51 +121,56 @@ class VLLMTester:
             print(f"✗ Failed to list models: {e}")
             return None
 
-    def test_completion(self, model: str) -> bool:
-        """Test basic completion endpoint."""
-        print(f"\n--- Testing Completion API ---")
+    async def test_completion(
+        self, model: str, out: Optional[TextIO] = None
+    ) -> bool:
+        """Test basic completion endpoint, printing to out (default stdout)."""
+        out = out if out is not None else sys.stdout
+        print(f"\n--- Testing Completion API ---", file=out)
         try:
             prompt = "The capital of France is"
-            print(f"Prompt: {prompt}")
+            print(f"Prompt: {prompt}", file=out)
+            body = orjson.dumps({
+                "model": model,
+                "prompt": prompt,
+                "max_tokens": 50,
+                "temperature": 0.7,
+            })
 
             start_time = time.time()
-            response = requests.post(
-                f"{self.v1_url}/completions",
-                json={
-                    "model": model,
-                    "prompt": prompt,
-                    "max_tokens": 50,
-                    "temperature": 0.7,
-                },
-                timeout=30,
+            response = await self.http.post(
+                f"{self.v1_url}/completions", content=body
             )
             elapsed = time.time() - start_time
 
             if response.status_code == 200:
                 data = response.json()
                 text = data["choices"][0]["text"]
-                print(f"Response: {text}")
-                print(f"✓ Completion succeeded ({elapsed:.2f}s)")
+                print(f"Response: {text}", file=out)
+                print(f"✓ Completion succeeded ({elapsed:.2f}s)", file=out)
                 return True
             else:
-                print(f"✗ Completion failed: {response.status_code}")
-                print(f"  Response: {response.text}")
+                print(f"✗ Completion failed: {response.status_code}", file=out)
+                print(f"  Response: {response.text}", file=out)
                 return False
         except Exception as e:
-            print(f"✗ Completion failed: {e}")
+            print(f"✗ Completion failed: {e}", file=out)
             return False
 
-    def test_chat_completion(self, model: str) -> bool:
-        """Test chat completion endpoint using OpenAI client."""
-        print(f"\n--- Testing Chat Completion API ---")
+    async def test_chat_completion(
+        self, model: str, out: Optional[TextIO] = None
+    ) -> bool:
+        """Test chat completion via the OpenAI client, printing to out (default stdout)."""
+        out = out if out is not None else sys.stdout
+        print(f"\n--- Testing Chat Completion API ---", file=out)
         try:
             messages = [
                 {"role": "user", "content": "Explain Docker in one sentence."}
             ]
-            print(f"Messages: {json.dumps(messages, indent=2)}")
+            print(f"Messages: {json.dumps(messages, indent=2)}", file=out)
 
             start_time = time.time()
-            response = self.client.chat.completions.create(
+            response = await self.client.chat.completions.create(
                 model=model,
                 messages=messages,
                 max_tokens=100,
@@ -114,59 +179,84 @@ class VLLMTester:
             elapsed = time.time() - start_time
 
             content = response.choices[0].message.content
-            print(f"Response: {content}")
-            print(f"✓ Chat completion succeeded ({elapsed:.2f}s)")
+            print(f"Response: {content}", file=out)
+            usage = response.usage
+            if usage and elapsed > 0:
+                print(
+                    f"Tokens: {usage.prompt_tokens} prompt, "
+                    f"{usage.completion_tokens} completion "
+                    f"({usage.completion_tokens / elapsed:.1f} tok/s)",
+                    file=out,
+                )
+            print(f"✓ Chat completion succeeded ({elapsed:.2f}s)", file=out)
             return True
         except Exception as e:
-            print(f"✗ Chat completion failed: {e}")
+            print(f"✗ Chat completion failed: {e}", file=out)
             return False
 
-    def test_streaming(self, model: str) -> bool:
-        """Test streaming response."""
-        print(f"\n--- Testing Streaming API ---")
+    async def test_streaming(
+        self, model: str, out: Optional[TextIO] = None
+    ) -> bool:
+        """Test streaming response, printing to out (default stdout)."""
+        out = out if out is not None else sys.stdout
+        print(f"\n--- Testing Streaming API ---", file=out)
         try:
             prompt = "Write a haiku about containers:"
-            print(f"Prompt: {prompt}")
-            print("Response: ", end="", flush=True)
+            print(f"Prompt: {prompt}", file=out)
+            print("Response: ", end="", flush=True, file=out)
+            body = orjson.dumps({
+                "model": model,
+                "prompt": prompt,
+                "max_tokens": 50,
+                "temperature": 0.8,
+                "stream": True,
+            })
 
             start_time = time.time()
-            response = requests.post(
-                f"{self.v1_url}/completions",
-                json={
-                    "model": model,
-                    "prompt": prompt,
-                    "max_tokens": 50,
-                    "temperature": 0.8,
-                    "stream": True,
-                },
-                stream=True,
-                timeout=30,
-            )
-
-            full_text = ""
-            for line in response.iter_lines():
-                if line:
-                    line = line.decode("utf-8")
-                    if line.startswith("data: "):
-                        data_str = line[6:]  # Remove "data: " prefix
-                        if data_str == "[DONE]":
+            async with self.http.stream(
+                "POST", f"{self.v1_url}/completions", content=body
+            ) as response:
+                # Scan raw bytes for SSE event boundaries and only decode
+                # the JSON payload of each "data:" event
+                buf = bytearray()
+                done = False
+                # Coalesce tokens into one stdout write every 50 ms
+                parts = []
+                last = time.monotonic()
+                async for chunk in response.aiter_bytes(chunk_size=4096):
+                    buf += chunk
+                    while True:
+                        end = buf.find(b"\n\n")
+                        if end < 0:
                             break
-                        try:
-                            data = json.loads(data_str)
-                            text = data["choices"][0]["text"]
-                            print(text, end="", flush=True)
-                            full_text += text
-                        except json.JSONDecodeError:
+                        event = bytes(buf[:end])
+                        del buf[:end + 2]
+                        if not event.startswith(b"data: "):
                             continue
+                        payload = event[6:]  # Remove "data: " prefix
+                        if payload == b"[DONE]":
+                            done = True
+                            break
+                        data = orjson.loads(payload)
+                        parts.append(data["choices"][0]["text"])
+                    if parts and time.monotonic() - last > 0.05:
+                        out.write("".join(parts))
+                        out.flush()
+                        parts.clear()
+                        last = time.monotonic()
+                    if done:
+                        break
+                out.write("".join(parts))
+                out.flush()
 
             elapsed = time.time() - start_time
-            print(f"\n✓ Streaming succeeded ({elapsed:.2f}s)")
+            print(f"\n✓ Streaming succeeded ({elapsed:.2f}s)", file=out)
             return True
         except Exception as e:
-            print(f"\n✗ Streaming failed: {e}")
+            print(f"\n✗ Streaming failed: {e}", file=out)
             return False
 
-    def test_performance(self, model: str, num_requests: int = 5) -> None:
+    async def test_performance(self, model: str, num_requests: int = 5) -> None:
         """Test performance with multiple requests."""
         print(f"\n--- Testing Performance ({num_requests} requests) ---")
         prompts = [
@@ -177,38 +267,72 @@ class VLLMTester:
             "What is continuous integration?",
         ]
 
-        times = []
-        for i, prompt in enumerate(prompts[:num_requests], 1):
+        async def _one(body: bytes):
+            start_time = time.time()
             try:
-                start_time = time.time()
-                response = requests.post(
-                    f"{self.v1_url}/completions",
-                    json={
-                        "model": model,
-                        "prompt": prompt,
-                        "max_tokens": 30,
-                        "temperature": 0.7,
-                    },
-                    timeout=30,
+                response = await self.http.post(
+                    f"{self.v1_url}/completions", content=body
                 )
-                elapsed = time.time() - start_time
-
-                if response.status_code == 200:
-                    times.append(elapsed)
-                    print(f"  Request {i}: {elapsed:.2f}s")
-                else:
-                    print(f"  Request {i}: Failed ({response.status_code})")
+                return start_time, time.time(), response.status_code
             except Exception as e:
-                print(f"  Request {i}: Failed ({e})")
+                return start_time, time.time(), e
+
+        # Submit all requests at once so vLLM can batch them
+        # Encode request bodies up front so timings only cover the server
+        body_template = {"model": model, "max_tokens": 30, "temperature": 0.7}
+        bodies = [
+            orjson.dumps({**body_template, "prompt": prompt})
+            for prompt in prompts[:num_requests]
+        ]
+        results = await asyncio.gather(*(_one(body) for body in bodies))
+
+        times = []
+        starts = []
+        ends = []
+        for i, (start_time, end_time, status) in enumerate(results, 1):
+            elapsed = end_time - start_time
+            if status == 200:
+                times.append(elapsed)
+                starts.append(start_time)
+                ends.append(end_time)
+                print(f"  Request {i}: {elapsed:.2f}s")
+            else:
+                print(f"  Request {i}: Failed ({status})")
 
         if times:
             avg_time = sum(times) / len(times)
             min_time = min(times)
             max_time = max(times)
+            wall_time = max(ends) - min(starts)
             print(f"\nPerformance Summary:")
             print(f"  Average: {avg_time:.2f}s")
             print(f"  Min: {min_time:.2f}s")
             print(f"  Max: {max_time:.2f}s")
+            print(f"  Wall time: {wall_time:.2f}s")
+            if wall_time > 0:
+                print(f"  Throughput: {len(times) / wall_time:.2f} req/s")
+
+
+async def run_tests(tester: VLLMTester, model: str) -> list:
+    """Run the API tests concurrently, then the performance test."""
+    try:
+        # Streaming prints live; the other tests are buffered so their
+        # output doesn't interleave with it and is printed afterwards
+        buffers = [io.StringIO(), io.StringIO()]
+        results = await asyncio.gather(
+            tester.test_streaming(model),
+            tester.test_completion(model, out=buffers[0]),
+            tester.test_chat_completion(model, out=buffers[1]),
+        )
+        for buffer in buffers:
+            print(buffer.getvalue(), end="")
+        print("\nNote: the tests above ran concurrently, so their timings")
+        print("include contention and are not single-request latencies.")
+
+        await tester.test_performance(model, num_requests=3)
+    finally:
+        await tester.aclose()
+    return results
 
 
 def main():
@@ -244,26 +368,13 @@ def main():
     print("Running Tests")
     print("=" * 60)
 
-    success_count = 0
-    total_tests = 0
-
-    # Test 1: Basic completion
-    total_tests += 1
-    if tester.test_completion(model_name):
-        success_count += 1
-
-    # Test 2: Chat completion
-    total_tests += 1
-    if tester.test_chat_completion(model_name):
-        success_count += 1
-
-    # Test 3: Streaming
-    total_tests += 1
-    if tester.test_streaming(model_name):
-        success_count += 1
+    # Tests 1-3 (completion, chat, streaming) run concurrently,
+    # followed by test 4 (performance)
+    results = asyncio.run(run_tests(tester, model_name))
+    success_count = sum(results)
+    total_tests = len(results)
 
-    # Test 4: Performance
-    tester.test_performance(model_name, num_requests=3)
+    tester.close()
 
     # Summary
     print("\n" + "=" * 60)